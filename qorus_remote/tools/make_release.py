@@ -1,67 +1,105 @@
 #!/usr/bin/env python3
 
 import argparse
+import bz2
+import concurrent.futures
+import contextlib
 import datetime
-import getpass
+import functools
 import glob
+import gzip
+import importlib.resources
+import io
 import os
-import platform
 import re
 import shutil
 import socket
+import subprocess
 import sys
 import tarfile
 import tempfile
 import yaml
 import stat
-import time
 
 import pkgutil
 
 
-LoadFileTypes = {
-    "qfd": True,
-    "qsd": True,
-    "java": True,
-    "qclass": True,
-    "qconst": True,
-    "qwf": True,
-    "qjob": True,
-    "qconn": True,
-    "qsm": True,
-    "qmapper": True,
-    "qvmap": True,
-    "qscript": True,
-    "qstep": True,
-    "qmc": True,
-    "yaml": True,
-    "py": True
-}
+LoadFileTypes = frozenset({
+    "qfd",
+    "qsd",
+    "java",
+    "qclass",
+    "qconst",
+    "qwf",
+    "qjob",
+    "qconn",
+    "qsm",
+    "qmapper",
+    "qvmap",
+    "qscript",
+    "qstep",
+    "qmc",
+    "yaml",
+    "py"
+})
 
 # file extensions to be ignored when packaging a release
-ExtraFileTypes = {
-    "wsdl": True,
-    "xml": True,
-    "xsd": True,
-    "dtd": True,
-    "qm": True,
-    "qlib": True,
-    "jar": True,
-    "class": True,
-    "json": True,
-    "qtest": True,
-    "qc": True,
-    "qhtml": True,
-    "qjs": True,
-    "qjson": True,
-}
-
-def readonly_rmtree_handler(func, path, execinfo):
-    if not os.access(path, os.W_OK):
-        os.chmod(path, stat.S_IWUSR)  # or os.chmod(path, stat.S_IWRITE) from "stat" module
-        func(path)
-    else:
-        raise
+ExtraFileTypes = frozenset({
+    "wsdl",
+    "xml",
+    "xsd",
+    "dtd",
+    "qm",
+    "qlib",
+    "jar",
+    "class",
+    "json",
+    "qtest",
+    "qc",
+    "qhtml",
+    "qjs",
+    "qjson",
+})
+
+# YAML loader for parsing object definitions; use the libyaml-based loader if available
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+class _CachedIdLookup:
+    # proxy for the pwd and grp modules that caches the given lookup function by id
+    def __init__(self, module, func_name: str):
+        self._module = module
+        setattr(self, func_name, functools.lru_cache(maxsize=None)(getattr(module, func_name)))
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+# tarfile looks up the user and group names for every file added to an archive, which are
+# normally all the same, so cache the lookups
+if getattr(tarfile, "pwd", None):
+    tarfile.pwd = _CachedIdLookup(tarfile.pwd, "getpwuid")
+if getattr(tarfile, "grp", None):
+    tarfile.grp = _CachedIdLookup(tarfile.grp, "getgrgid")
+
+# resource declarations in old-style service files
+_QSD_RESOURCE_RE = re.compile(r'#[ \t]*(resource|templates|bin-resource|text-resource)[ \t]*:[ \t]*(.+)$')
+
+# True if running on Windows
+_IS_WINDOWS: bool = os.name == 'nt'
+
+# bzip2 archives always use the maximum block size; bzip2's speed hardly depends on the level, so
+# --compress-level only applies to gzip
+_BZ2_LEVEL: int = 9
+
+# maximum number of threads used for I/O-bound file system scans
+_MAX_WORKERS: int = min(32, (os.cpu_count() or 1) * 4)
+
+def _is_glob(path: str) -> bool:
+    # returns True if the given path contains glob wildcard characters
+    return '*' in path or '?' in path
+
+def _have(cmd: str) -> bool:
+    # returns True if the given external command is available in the PATH
+    return shutil.which(cmd) is not None
 
 class MakeReleaseParser(argparse.ArgumentParser):
     def error(self, message):
@@ -79,9 +117,6 @@ class MakeReleaseParser(argparse.ArgumentParser):
         sys.exit(1)
 
 class MakeRelease:
-    # main release dir
-    release_dir: str = "make-release-{}-{}-pid-{}".format(socket.gethostname(), getpass.getuser(), os.getpid())
-
     # service resource types
     YamlServiceResources: tuple = [
         "resource",
@@ -120,23 +155,32 @@ class MakeRelease:
 
     @staticmethod
     def mkdir(d: str, msg: str = '', mode: int = 0o777) -> None:
-        # do not try to create a directory that already exists
-        if os.path.isdir(d):
-            return
         try:
             os.makedirs(d, mode)
             print("mkdir " + d)
+        except FileExistsError as e:
+            # do not try to create a directory that already exists
+            if not os.path.isdir(d):
+                MakeRelease.error(d + ": mkdir({}) failed: " + repr(e))
         except Exception as e:
             MakeRelease.error(d + ": mkdir({}) failed: " + repr(e))
 
     @staticmethod
-    def doCmd(cmd: str):
-        # cmd = '{} {}'.format(fmt, argv)
+    def doCmd(cmd, cwd: str = None):
+        # cmd is an argv list; a string is executed with the shell for backwards compatibility
         # if self._opts.verbose:
         #     print("exec: {}".format(cmd))
-        rc = os.system(cmd)
-        if rc > 0:
-            raise Exception("SYSTEM-ERROR", "command: {} returned error code {}".format(cmd, rc))
+        rc = subprocess.run(cmd, shell=isinstance(cmd, str), cwd=cwd).returncode
+        if rc:
+            raise Exception("SYSTEM-ERROR", "command: {} returned error code {}".format(
+                cmd if isinstance(cmd, str) else " ".join(cmd), rc))
+
+    @staticmethod
+    def openPackageResource(path: str):
+        # streams the resource from the package; importlib.resources.files() is only available with Python 3.9+
+        if __package__ and hasattr(importlib.resources, "files"):
+            return importlib.resources.files(__package__).joinpath(path).open("rb")
+        return io.BytesIO(pkgutil.get_data(__name__, path))
 
     @staticmethod
     def error(*args, **kwargs):
@@ -160,6 +204,8 @@ class MakeRelease:
         self._ulist: list = []
         self._rname: str = ''
         self._tar: str = ''
+        # directories already created or checked
+        self._created_dirs: set = set()
 
         # set release dir
         self._rdir = os.getenv('QORUS_RELEASE_DIR')
@@ -171,9 +217,6 @@ class MakeRelease:
             self._rdir = os.path.join(os.getcwd(), "releases")
         # print(self._rdir)
 
-        # set temp dir
-        self._tmpdir = os.path.join(os.getcwd(), "temp")
-
         # get current working dir
         self._cwd = os.getcwd()
 
@@ -190,16 +233,20 @@ class MakeRelease:
         _parser.add_argument('-P', '--add-prefix', dest='padd', help="""prepends a prefix dir for relative paths in the
                             target filesystem (implies -U.)""")
         _parser.add_argument('-r', '--release-dir', dest='rdir', help='set release directory (def: {})'.format(self._rdir))
-        _parser.add_argument('-q', '--user-sql', dest='usql', default=[], help='adds an SQL file to execute in the omquser schema')
+        _parser.add_argument('-q', '--user-sql', dest='usql', default=[], action='append', help='adds an SQL file to execute in the omquser schema')
         _parser.add_argument('-R', '--show-release-dir', dest='showr', action='store_true', help="""show the release directory
                              and exit (def: {})""".format(self._rdir))
         _parser.add_argument('-c', '--compress', dest='comp', action='store_true', help='make a compressed tar file of the release')
+        _parser.add_argument('--compress-level', dest='clevel', type=int, default=1, choices=range(1, 10),
+                             metavar='LEVEL', help="""compression level for .tar.gz files (1-9, def: 1);
+                             .tar.bz2 files are always compressed at level 9""")
         _parser.add_argument('-f', '--refresh', dest='ref', action='store_true', help='include commands to refresh objects after loading')
         _parser.add_argument('-C', '--refresh-compat', dest='rcompat', action='store_true', help="""include old commands to refresh objects after
                             loading""")
         _parser.add_argument('-F', '--full-release', dest='full', action='store_true', help='verify release completeness, only with -i')
         _parser.add_argument('-i', '--install', dest='inst', action='store_true', help='exec install.sh after packaging (user rel. only)')
-        _parser.add_argument('--keep', dest='keep', action='store_true', help='do not delete temporary packaging directory')
+        _parser.add_argument('--keep', dest='keep', action='store_true', help="""no effect; releases are no longer staged
+                             in a temporary directory (kept for compatibility)""")
         _parser.add_argument('-v', '--verbose', dest='verbose', default=False, action='store_true', help='output more information')
         _parser.add_argument('--usage', dest='usage', action='store_true', help='show this help text')
         _parser.add_argument('-a', '--python-modules', dest='pymoddir', help="""package the given directory as a Python module dir
@@ -220,7 +267,8 @@ class MakeRelease:
         if self._opts.user:
             self._opts.user = MakeRelease.getLabel("qorus-user-", self._opts.user)
 
-        if not self._opts.usrc and (self._opts.pref or self._opts.padd):
+        # if no user source listed, then set to current directory
+        if not self._opts.usrc:
             self._opts.usrc = "."
 
         self._opts.usrc = os.path.abspath(self._opts.usrc)
@@ -232,10 +280,6 @@ class MakeRelease:
         if self._opts.padd:
             self._opts.padd = self.fixPrefix(self._opts.padd)
 
-        # if no user source listed, then set to current directory
-        if not self._opts.usrc:
-            self._opts.usrc = "."
-
         # set pymoddir/pymoddest
         if self._opts.pymoddir:
             if not self._opts.pymoddest:
@@ -249,81 +293,148 @@ class MakeRelease:
             sys.stderr.write("ERROR: release file component {} is an absolute path; must be a relative path from {}".format(path, self._opts.usrc))
             sys.exit(1)
 
-    def doFile2(self, file_list, d, path):
+    def srcPath(self, path: str) -> str:
+        # returns the full path of a release component given relative to the user source dir
+        return os.path.join(self._opts.usrc, path)
+
+    def srcGlob(self, path: str, recursive: bool = False) -> list:
+        # expands a glob relative to the user source dir; matches are returned relative to the same dir
+        return [os.path.relpath(p, self._opts.usrc) for p in glob.glob(os.path.join(glob.escape(self._opts.usrc), path),
+            recursive=recursive)]
+
+    def doFile2(self, file_list, d, path, notes: list = None):
+        # if a notes list is given, messages are added to it instead of being printed
         self.checkAbsolutePath(path)
 
         # skip backup files
-        if re.search('~$', path):
+        if path.endswith('~'):
             return
 
         # skip release files
-        if re.search('\\.qrf$', path):
-            print('skipping release file \'{}\''.format(path))
+        if path.endswith('.qrf'):
+            MakeRelease.note(notes, 'skipping release file \'{}\''.format(path))
             return
 
         if os.path.isdir(os.path.join(d, path)):
             # skip files in "old" directories
-            if re.search('old$', path):
+            if path.endswith('old'):
                 return
-            for path1 in glob.glob(os.path.join(os.path.join(d, path), "*")):
-                self.doFile2(file_list, d, os.path.join(path, os.path.basename(path1)))
+            self.doDir(file_list, os.path.join(d, path), path, notes)
             return
 
         file_list.append(path)
 
-    def doFile(self, path):
-        self.checkAbsolutePath(path)
+    def doDir(self, file_list: list, dir_path: str, path: str, notes: list = None):
+        # scan the directory once; entry types come from the directory listing without an extra stat()
+        # where the file system supports it
+        with os.scandir(dir_path) as it:
+            entries: list = list(it)
+
+        entry: os.DirEntry
+        for entry in entries:
+            # skip hidden files like glob('*') does
+            if entry.name.startswith('.'):
+                continue
+
+            # skip backup files
+            if entry.name.endswith('~'):
+                continue
+
+            entry_path: str = os.path.join(path, entry.name)
+
+            # skip release files
+            if entry.name.endswith('.qrf'):
+                MakeRelease.note(notes, 'skipping release file \'{}\''.format(entry_path))
+                continue
+
+            if entry.is_dir():
+                # skip files in "old" directories
+                if entry.name.endswith('old'):
+                    continue
+                self.doDir(file_list, entry.path, entry_path, notes)
+                continue
+
+            file_list.append(entry_path)
+
+    @staticmethod
+    def note(notes: list, msg: str):
+        if notes is None:
+            print(msg)
+        else:
+            notes.append(msg)
+
+    def doFile(self, path: str) -> tuple:
+        # runs in a worker thread: returns the files found, any messages and any error, so that the
+        # caller can report them in argument order; absolute paths are rejected by the caller
+        file_list: list = []
+        notes: list = []
 
         # skip backup files
-        if re.search('~$', path):
-            return
+        if path.endswith('~'):
+            return file_list, notes, None
 
-        self.doFile2(self._ulist, self._opts.usrc, path)
+        self.doFile2(file_list, self._opts.usrc, path, notes)
 
-        if not MakeRelease.is_readable(path):
-            print("ERROR: cannot find file '{}'".format(path))
-            sys.exit(1)
+        if not MakeRelease.is_readable(self.srcPath(path)):
+            return file_list, notes, "ERROR: cannot find file '{}'".format(path)
+
+        return file_list, notes, None
 
     def checkFiles(self, args):
         # make file lists
         self._ulist: list = []
 
-        cwd = os.getcwd()
-        os.chdir(self._opts.usrc)
+        # absolute paths must be rejected before globbing, as joining them to the source dir would
+        # discard the source dir
+        path: str
+        for path in args:
+            self.checkAbsolutePath(path)
 
-        try:
-            # and check to see if all files exist
+        with concurrent.futures.ThreadPoolExecutor(max_workers=_MAX_WORKERS) as executor:
+            # expand globs in parallel
+            patterns: list = [path for path in args if _is_glob(path)]
+            globs: dict = dict(zip(patterns, executor.map(functools.partial(self.srcGlob, recursive=True),
+                patterns)))
+
+            paths: list = []
             for path in args:
-                if re.search('[*?]', path):
-                    paths = glob.glob(path, recursive=True)
-                    if not paths:
+                if path in globs:
+                    if not globs[path]:
                         sys.stderr.write("ERROR: path {} does not match any files\n".format(path))
                         sys.stderr.flush()
                         sys.exit(1)
-                    for path_item in paths:
-                        self.doFile(path_item)
+                    paths.extend(globs[path])
                     continue
 
-                self.doFile(path)
-        finally:
-            os.chdir(cwd)
+                paths.append(path)
+
+            # and check to see if all files exist; each path is scanned in parallel into its own
+            # list, which are then added in order
+            file_list: list
+            notes: list
+            err: str
+            for file_list, notes, err in executor.map(self.doFile, paths):
+                for note in notes:
+                    print(note)
+                if err:
+                    print(err)
+                    sys.exit(1)
+                self._ulist.extend(file_list)
 
     def makeList(self, file_list: list, resource_list: list) -> list:
         # make a set of the file list for quick lookups
-        file_map: dict = {i: True for i in file_list}
+        file_map: set = set(file_list)
 
         madeList: list = []
+        # bind the method locally for the loop
+        processFile = self.processFile
+        # entries have already been expanded to concrete files by checkFiles()
         entry: str
         for entry in file_list:
-            if re.search('~$', entry):
+            if entry.endswith('~'):
                 continue
 
-            if re.search('[*?]', entry):
-                e: str
-                for e in glob.glob(entry):
-                    self.processFile(e, file_map, madeList, resource_list)
-            else:
-                self.processFile(entry, file_map, madeList, resource_list)
+            processFile(entry, file_map, madeList, resource_list)
 
         return madeList
 
@@ -332,44 +443,39 @@ class MakeRelease:
         d: str = os.path.dirname(entry)
         resource_path: str = os.path.join(d, resource_name)
 
-        if not re.search('[*?]', resource_name):
-            if not MakeRelease.is_readable(resource_path):
+        if not _is_glob(resource_name):
+            if not MakeRelease.is_readable(self.srcPath(resource_path)):
                 MakeRelease.error("service {} references resource {} that does not exist ({})".format(entry,
                     resource_name, re.error))
-        elif not glob.glob(resource_path):
+        elif not self.srcGlob(resource_path):
             MakeRelease.error("service {} references resource glob {} that does not match any files".format(
                 entry, resource_name))
         resource_list.append({
-            'source': resource_path,
+            'source': self.srcPath(resource_path),
             'target': resource_name,
         })
 
-    def processFile(self, entry: str, file_map: dict, madeList: list, resource_list: list):
+    def processFile(self, entry: str, file_map: set, madeList: list, resource_list: list):
         madeList.append(entry)
 
-        if re.search('\\.yaml$', entry):
+        if entry.endswith('.yaml'):
             try:
                 # try to parse the YAML and see if it has a code reference that can be added to the release
-                with open(entry) as e:
-                    fh = yaml.full_load(e)
+                with open(self.srcPath(entry), 'rb') as e:
+                    fh = yaml.load(e, Loader=YamlLoader)
                     if 'code' in fh:
                         src = fh['code']
                         src = os.path.join(os.path.dirname(entry), src)
-                        if MakeRelease.is_readable(src) and src not in file_map:
-                            file_map[src] = True
+                        if MakeRelease.is_readable(self.srcPath(src)) and src not in file_map:
+                            file_map.add(src)
                             madeList.append(src)
 
-                    am = None
-                    if 'api-manager' in fh \
-                        and 'provider-options' in fh['api-manager'] \
-                        and 'schema' in fh['api-manager']['provider-options'] \
-                        and 'value' in fh['api-manager']['provider-options']['schema']:
-                        am = fh['api-manager']['provider-options']['schema']['value']
+                    am = fh.get('api-manager', {}).get('provider-options', {}).get('schema', {}).get('value')
 
                     #print('am: {}'.format(am))
 
                     # process resources from Qorus services
-                    if re.search('\\.qsd\\.yaml$', entry):
+                    if entry.endswith('.qsd.yaml'):
                         resource_type: str
                         for resource_type in MakeRelease.YamlServiceResources:
                             resource_name: str
@@ -378,68 +484,145 @@ class MakeRelease:
                                     self.processResource(entry, resource_list, resource_name)
 
                         # add API management resources
-                        if 'api-manager' in fh \
-                            and 'provider-options' in fh['api-manager'] \
-                            and 'schema' in fh['api-manager']['provider-options'] \
-                            and 'value' in fh['api-manager']['provider-options']['schema']:
-                            self.processResource(entry, resource_list,
-                                fh['api-manager']['provider-options']['schema']['value'])
+                        if am:
+                            self.processResource(entry, resource_list, am)
 
             except Exception as e:
                 print(e)
                 pass
 
         # add service resources to released from old-style service files
-        if resource_list and re.search('\\.qsd$', entry):
-            with open(entry) as e:
-                lines = e.readLines()
+        if entry.endswith('.qsd'):
+            with open(self.srcPath(entry)) as e:
+                lines = e.read().splitlines()
 
             for line in lines:
-                resource_name = re.match('#[[:blank:]]*(resource|templates|bin-resource|text-resource)[[:blank:]]*:[[:blank:]]*(.+)/[1]', line)
+                m = _QSD_RESOURCE_RE.match(line)
 
-                if resource_name:
-                    resource_name = resource_name.strip()
+                if m:
+                    resource_name = m.group(2).strip()
                     self.processResource(entry, resource_list, resource_name)
 
-    def delTree(self, targ):
-        shutil.rmtree(targ, onerror=readonly_rmtree_handler)
-
-    def deleteFolder(self, path):
-        for obj in glob.glob(os.path.join(path, '*')):
-            print('obj name is ', obj)
-            if os.path.isdir(obj):
-                self.deleteFolder(obj)
-        print('removing path ', path)
-        print(os.listdir(path))
-        shutil.rmtree(path, False)
-        time.sleep(1)
-
-    def doCreateTar(self, opt: str, tarf: str, files: list, exclude: bool = False):
-        with tarfile.open(tarf, 'w:{}'.format(opt)) as tar:
+    @staticmethod
+    def getCompressCmd(opt: str, level: int) -> list:
+        # returns the argv of an external compressor for the given tarfile compression type, if any
+        if opt == "gz":
+            if _have("pigz"):
+                return ["pigz", "-p", str(os.cpu_count() or 1), "-{}".format(level)]
+            if _have("gzip"):
+                return ["gzip", "-{}".format(level)]
+        elif opt == "bz2":
+            # prefer parallel bzip2 implementations; the output is a standard bzip2 stream
+            if _have("lbzip2"):
+                return ["lbzip2", "-c", "-n", str(os.cpu_count() or 1), "-{}".format(_BZ2_LEVEL)]
+            if _have("pbzip2"):
+                return ["pbzip2", "-c", "-p{}".format(os.cpu_count() or 1), "-{}".format(_BZ2_LEVEL)]
+            if _have("bzip2"):
+                return ["bzip2", "-c", "-{}".format(_BZ2_LEVEL)]
+        return []
+
+    @staticmethod
+    def openCompressStream(opt: str, fileobj, level: int):
+        # returns a compressing file object for the given tarfile compression type
+        if opt == "gz":
+            return gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=level)
+        if opt == "bz2":
+            return bz2.BZ2File(fileobj, "wb", compresslevel=_BZ2_LEVEL)
+        raise ValueError("unsupported tar compression type: {}".format(opt))
+
+    def doCreateTar(self, opt: str, tarf: str, files: list, exclude: bool = False, root: str = '.'):
+        # files are given relative to the root dir and are stored with these names in the archive
+        # use the native tar binary piped to an external compressor if possible
+        comp_cmd: list = MakeRelease.getCompressCmd(opt, self._opts.clevel) if _have("tar") else []
+        if comp_cmd:
+            self.doCreateTarExternal(comp_cmd, tarf, files, exclude, root)
+            return
+
+        with self.openTarStream(opt, tarf) as tar:
             for f in files:
                 if exclude:
-                    tar.add(f, filter=lambda tarinfo: None if re.search('~$', tarinfo.name) else tarinfo)
+                    tar.add(os.path.join(root, f), arcname=f,
+                        filter=lambda tarinfo: None if tarinfo.name.endswith('~') else tarinfo)
                 else:
-                    tar.add(f)
-            tar.close()
-
-    def doExtractTar(self, opt, tarf, dest='.'):
-        with tarfile.open(tarf, 'r:{}'.format(opt)) as tar:
-            tar.extractall(path=dest)
-
-    def copyFiles(self, files, target):
-        for f in files:
-            if os.path.isdir(f):
-                shutil.copytree(f, target)
-            else:
-                shutil.copy(f, target)
+                    tar.add(os.path.join(root, f), arcname=f)
+
+    def doCreateTarExternal(self, comp_cmd: list, tarf: str, files: list, exclude: bool = False, root: str = '.'):
+        tar_cmd: list = ["tar"]
+        if exclude:
+            # skip backup files; this is what the tarfile filter does for the fallback; the option
+            # must precede the file list to take effect
+            files = [f for f in files if not f.endswith('~')]
+            tar_cmd.append("--exclude=*~")
+
+        # write the NUL-separated file list to a temporary file for "tar -T"
+        with tempfile.NamedTemporaryFile("wb", suffix=".lst", delete=False) as lf:
+            for f in files:
+                lf.write(os.fsencode(f) + b"\0")
+        tar_cmd += ["-C", root, "--null", "-T", lf.name, "-cf", "-"]
 
-    def logDebug(self, *args, **kwargs):
-        if self._opts.verbose:
-            print(*args, **kwargs)
+        try:
+            with open(tarf, "wb") as out:
+                tar_proc = subprocess.Popen(tar_cmd, stdout=subprocess.PIPE)
+                comp_proc = subprocess.Popen(comp_cmd, stdin=tar_proc.stdout, stdout=out)
+                # allow tar to receive SIGPIPE if the compressor exits early
+                tar_proc.stdout.close()
+                comp_rc: int = comp_proc.wait()
+                tar_rc: int = tar_proc.wait()
+            if tar_rc:
+                raise Exception("SYSTEM-ERROR", "command: {} returned error code {}".format(" ".join(tar_cmd), tar_rc))
+            if comp_rc:
+                raise Exception("SYSTEM-ERROR", "command: {} returned error code {}".format(" ".join(comp_cmd), comp_rc))
+        finally:
+            os.unlink(lf.name)
+
+    @contextlib.contextmanager
+    def openTarStream(self, opt: str, tarf: str):
+        # writes the archive in stream mode through a separate compressor, as "w|gz" only accepts a
+        # compression level with Python 3.12+; an external compressor is used if available
+        comp_cmd: list = MakeRelease.getCompressCmd(opt, self._opts.clevel)
+        with open(tarf, "wb", buffering=1 << 20) as raw:
+            if not comp_cmd:
+                with MakeRelease.openCompressStream(opt, raw, self._opts.clevel) as out, \
+                        tarfile.open(fileobj=out, mode="w|", bufsize=tarfile.RECORDSIZE * 64) as tar:
+                    yield tar
+                return
 
-    def doResources(self, resource_list: list, dir_name: str):
-        dh: dict = {}
+            comp_proc = subprocess.Popen(comp_cmd, stdin=subprocess.PIPE, stdout=raw)
+            try:
+                with tarfile.open(fileobj=comp_proc.stdin, mode="w|", bufsize=tarfile.RECORDSIZE * 64) as tar:
+                    yield tar
+            finally:
+                comp_proc.stdin.close()
+                comp_rc: int = comp_proc.wait()
+            if comp_rc:
+                raise Exception("SYSTEM-ERROR", "command: {} returned error code {}".format(" ".join(comp_cmd), comp_rc))
+
+    def doCreateTarMembers(self, opt: str, tarf: str, members: dict):
+        # creates an archive from a map of archive names to source paths without staging the files
+        # in a temporary directory first
+        dirs: set = set()
+        with self.openTarStream(opt, tarf) as tar:
+            arcname: str
+            src: str
+            # normalize archive names so that "./" components do not create duplicate entries
+            for arcname, src in {os.path.normpath(k): v for k, v in members.items()}.items():
+                # add entries for parent directories like the staged directory tree had, taking the
+                # attributes from the source file's directory
+                parents: list = []
+                parent: str = os.path.dirname(arcname)
+                while parent and parent not in dirs:
+                    parents.append(parent)
+                    dirs.add(parent)
+                    parent = os.path.dirname(parent)
+                for parent in reversed(parents):
+                    tar.addfile(tar.gettarinfo(os.path.dirname(os.path.abspath(src)), arcname=parent))
+
+                tar.add(src, arcname=arcname)
+                if os.path.isdir(src):
+                    dirs.add(arcname)
+
+    # adds resources to the archive member map; dir_name is the target directory in the archive
+    def doResources(self, resource_list: list, dir_name: str, members: dict):
         rh: dict
         for rh in resource_list:
             d: str = os.path.dirname(rh['source'])
@@ -447,90 +630,89 @@ class MakeRelease:
 
             trdir: str = os.path.dirname(rh['target'])
             tdir: str = os.path.normpath(dir_name if trdir == '.' else os.path.join(dir_name, trdir))
-            if tdir not in dh:
-                if not os.path.isdir(tdir):
-                    MakeRelease.mkdir(tdir)
-
-                dh[tdir] = True
 
             # include all files in the subdirectory matching the pattern
-            if re.search('[*?]', fn):
+            if _is_glob(fn):
                 dc: str = os.path.dirname(fn)
                 if dc != ".":
                     fn = os.path.basename(fn)
                     d += os.path.sep + dc
 
-                self.doGlob(d, fn, tdir)
+                self.doGlob(d, fn, tdir, members)
             else:
-                self.copyFiles([rh['source']], tdir + os.path.sep)
+                members[os.path.join(tdir, fn)] = rh['source']
 
-    def doGlob(self, d: str, fn: str, tdir: str):
+    def doGlob(self, d: str, fn: str, tdir: str, members: dict):
         fstr: str
         for fstr in glob.glob(os.path.join(d, fn)):
             # skip files ending in "~" as backup files
-            if re.search('~$', fstr):
+            if fstr.endswith('~'):
                 continue
 
-            if os.path.isdir(fstr):
-                self.doGlob(d, os.path.join(fstr[len(d):], os.path.basename(fn)), tdir)
+            # get the file type with a single stat() call
+            try:
+                mode: int = os.stat(fstr).st_mode
+            except OSError:
                 continue
 
-            # skip special files, sockets, device files, etc
-            if not os.path.isfile(fstr):
+            if stat.S_ISDIR(mode):
+                self.doGlob(d, os.path.join(fstr[len(d):], os.path.basename(fn)), tdir, members)
                 continue
 
-            targ: str = tdir + os.path.sep
-            dir_name: str = os.path.dirname(fn)
-            if dir_name != ".":
-                targ += dir_name + os.path.sep
-                if not os.path.isdir(targ):
-                    MakeRelease.mkdir(targ)
+            # skip special files, sockets, device files, etc
+            if not stat.S_ISREG(mode):
+                continue
 
-            self.copyFiles([fstr], targ)
+            members[os.path.normpath(os.path.join(tdir, os.path.dirname(fn), os.path.basename(fstr)))] = fstr
 
     def createUserReleaseFile(self, path: str, load_list: list = []):
-        # create release file
-        with open(path, 'w') as f:
-            f.write("# automatically generated by {} on {} ({}@{})\n".format(os.path.basename(__file__),
-                datetime.datetime.now(), os.getenv('USER'), socket.gethostname()))
-
-            root_dir: str = os.path.dirname(path)
-            if root_dir == ".":
-                root_dir = ""
+        # create the release file contents in memory and write them at once
+        lines: list = ["# automatically generated by {} on {} ({}@{})\n".format(os.path.basename(__file__),
+            datetime.datetime.now(), os.getenv('USER'), socket.gethostname())]
+
+        root_dir: str = os.path.dirname(path)
+        if root_dir == ".":
+            root_dir = ""
+
+        fn: str
+        if not load_list:
+            load_list = self._ulist
+        load_lines: list = []
+        for fn in load_list:
+            # check for known file extensions
+            ext = MakeRelease.getExt(fn)
+            if not ext:
+                # see if it's an executable
+                if not os.access(self.srcPath(fn), os.X_OK):
+                    print("warning: no extension in file '{}'...".format(fn))
+            elif ext in LoadFileTypes:
+                load_lines.append("load {}\n".format(self.getLoadPath(fn, root_dir)))
+            elif ext not in ExtraFileTypes:
+                print("warning: unknown extension '{}' in file '{}'...".format(ext, fn))
+
+        load_text: str = "".join(load_lines)
+        if _IS_WINDOWS:
+            load_text = load_text.translate(str.maketrans('\\', '/'))
+        lines.append(load_text)
+
+        # now add user sql files
+        for fn in self._opts.usql:
+            # check for known file extensions
+            ext = MakeRelease.getExt(fn)
+
+            if not ext.endswith('sql'):
+               print("warning: user SQL file extension is not 'sql': {}".format(fn))
+
+            lines.append("omquser-exec-sql {}\n".format(self.getLoadPath(fn, root_dir)))
+
+        if self._opts.ref:
+            lines.append("refresh-recursive\n")
+        elif self._opts.rcompat:
+            lines.append("refresh-all\n")
 
-            fn: str
-            if not load_list:
-                load_list = self._ulist
-            for fn in load_list:
-                # check for known file extensions
-                ext = MakeRelease.getExt(fn)
-                if not ext:
-                    # see if it's an executable
-                    if not os.access(fn, os.X_OK):
-                        print("warning: no extension in file '{}'...".format(fn))
-                elif ext in LoadFileTypes:
-                    load_file_path: str = self.getLoadPath(fn, root_dir)
-                    if platform.system() == 'Windows':
-                        load_file_path = load_file_path.replace('\\', '/')
-                    # f.write("load {}\n".format(self.getLoadPath(fn, root_dir)))
-                    f.write("load {}\n".format(load_file_path))
-                elif ext not in ExtraFileTypes:
-                    print("warning: unknown extension '{}' in file '{}'...".format(ext, fn))
-
-            # now add user sql files
-            for fn in self._opts.usql:
-                # check for known file extensions
-                ext = MakeRelease.getExt(fn)
-
-                if not re.search('sql$', ext):
-                   print("warning: user SQL file extension is not 'sql': {}".format(fn))
-
-                f.write("omquser-exec-sql {}\n".format(self.getLoadPath(fn, root_dir)))
-
-            if self._opts.ref:
-                f.write("refresh-recursive\n")
-            elif self._opts.rcompat:
-                f.write("refresh-all\n")
+        # create release file
+        with open(path, 'w', buffering=1 << 20) as f:
+            f.writelines(lines)
 
         os.chmod(path, 0o644)
         print("created user release file {}".format(path))
@@ -546,18 +728,15 @@ class MakeRelease:
             return os.path.join(self._opts.padd, fn)
         return fn
 
-    def gettempdir(self):
-        temp_dir = tempfile.gettempdir()
-        if platform.system() == 'Windows':
-            temp_dir = self._tmpdir
-            if not os.path.isdir(temp_dir):
-                MakeRelease.mkdir(temp_dir)
-        return temp_dir
+    def ensureDir(self, d: str, mode: int = 0o777) -> None:
+        # creates the given directory if necessary; directories are only checked once per run
+        if d not in self._created_dirs:
+            MakeRelease.mkdir(d, mode=mode)
+            self._created_dirs.add(d)
 
     @staticmethod
     def getExt(fn):
-        m = re.match('.*\\.(.*)$', fn)
-        return m.groups()[0] if m else ''
+        return os.path.splitext(fn)[1][1:]
 
     def exec(self):
         if not self._args:
@@ -568,48 +747,41 @@ class MakeRelease:
         label = MakeRelease.getLabel("qorus-user-", self._opts.label)
 
         # check release directory
-        if not os.path.isdir(self._rdir):
-            MakeRelease.mkdir(self._rdir, "root release directory")
+        self.ensureDir(self._rdir)
 
         rname = os.path.normpath(os.path.join(self._rdir, label))
 
         ulabel = label
 
-        if not os.path.isdir(rname):
-            MakeRelease.mkdir(rname, "release directory")
+        self.ensureDir(rname)
 
         if not os.path.isfile(os.path.join(rname, "install.sh")):
-            # for packaging for PyPI, templates/install.sh has been moved inside the package of this module and is accessed as a resource using pkgutil.get_data
+            # for packaging for PyPI, templates/install.sh has been moved inside the package of this module and is accessed as a package resource
             # the original code is preserved as comments below
             _install_sh_pa = "templates/install.sh"
-            _install_sh = pkgutil.get_data(__name__, _install_sh_pa)
-            if not _install_sh: raise ValueError("_install_sh == " + repr(_install_sh))
             # pathname = os.path.join(os.path.join(os.path.dirname(os.path.realpath(__file__)), "templates"), "install.sh")
 
             # copy install.sh to new directory
-            with open(os.path.join(rname, "install.sh"), "wb") as _install_sh_out:
-                _install_sh_out.write(_install_sh)
-            # self.copyFiles([pathname], os.path.join(rname, "install.sh"))
+            with MakeRelease.openPackageResource(_install_sh_pa) as _install_sh, \
+                    open(os.path.join(rname, "install.sh"), "wb") as _install_sh_out:
+                shutil.copyfileobj(_install_sh, _install_sh_out, 1 << 20)
 
             print("copied <{}>{}{} to: {}".format(__package__, os.path.sep, _install_sh_pa, os.path.join(rname, "install.sh")))
             # print("copied:{} to:{}".format(pathname, os.path.join(rname, "install.sh")))
 
-        if not os.path.isdir(os.path.join(rname, "releases")):
-            # create releases subdirectory
-            if MakeRelease.mkdir(os.path.join(rname, "releases")):
-                MakeRelease.error("MakeRelease.mkdir({}) failed: {}".format(os.path.join(rname, "releases"), os.strerror(0)))
+        # create releases subdirectory
+        self.ensureDir(os.path.join(rname, "releases"))
 
         if self._ulist:
             tar_file_name: str = "{}.tar.gz".format(ulabel)
-            user_file_list: list = self._ulist
-            if self._opts.usql:
-                user_file_list += self._opts.usql
+            # do not modify self._ulist when adding the SQL files; they are only added to the archive and
+            # are executed with omquser-exec-sql, so load lists are built from self._ulist
+            user_file_list: list = list(self._ulist)
+            user_file_list.extend(self._opts.usql or [])
 
             # path -> info
             resource_list: list = []
 
-            os.chdir(self._opts.usrc)
-
             file_list: list = self.makeList(user_file_list, resource_list)
 
             # get base dir for files
@@ -620,130 +792,76 @@ class MakeRelease:
 
             load_list: list
 
+            # archive members: target path in the archive -> source path
+            members: dict
+
             # create release in prefix directory
-            to_delete = ''
             if self._opts.pref:
-                try:
-                    pdir = self._opts.pref
-
-                    if platform.system() == 'Windows':
-                        pdir = pdir.replace('/', '\\')
-
-                    path_component_list: list = pdir.split(os.path.sep)
-
-                    # get unique directory prefix name
-                    unique_dir = MakeRelease.release_dir
-                    dir_name: str = os.path.join(os.path.join(self.gettempdir(), unique_dir), pdir)
-
-                    # create install directory
-                    MakeRelease.mkdir(dir_name, mode=0o755)
-
-                    to_delete = os.path.join(self.gettempdir(), unique_dir)
-
-                    # copy files to temporary release directory
-                    fn: str
-                    for fn in file_list:
-                        file_base_dir: str = os.path.dirname(fn)
-                        targ_dir: str = dir_name
-                        if base_dir != file_base_dir and file_base_dir[0:len(base_dir) - 1] == base_dir:
-                            targ_dir = os.path.join(dir_name, file_base_dir[len(base_dir) + 1:]) + os.sep
-                            MakeRelease.mkdir(targ_dir)
-                        self.copyFiles([fn], targ_dir)
-
-                    load_list = [os.path.basename(e) for e in user_file_list]
-                    self.doResources(resource_list, dir_name)
-
-                    # create tar file
-                    os.chdir(os.path.join(self.gettempdir(), unique_dir))
-                    self.doCreateTar("gz", os.path.join(rname, tar_file_name), [path_component_list[0]])
-                    os.chdir(self._cwd)
-                finally:
-                    if not self._opts.keep and to_delete:
-                        self.delTree(to_delete)
+                pdir = self._opts.pref
+
+                if _IS_WINDOWS:
+                    pdir = pdir.replace('/', '\\')
+
+                # add files directly to the archive under the prefix directory
+                members = {}
+                fn: str
+                for fn in file_list:
+                    file_base_dir: str = os.path.dirname(fn)
+                    targ_dir: str = pdir
+                    if base_dir != file_base_dir and file_base_dir[0:len(base_dir) - 1] == base_dir:
+                        targ_dir = os.path.join(pdir, file_base_dir[len(base_dir) + 1:])
+                    members[os.path.join(targ_dir, os.path.basename(fn))] = self.srcPath(fn)
+
+                load_list = [os.path.basename(e) for e in self._ulist]
+                self.doResources(resource_list, pdir, members)
             elif self._opts.padd:
-                try:
-                    pdir = self._opts.padd
-
-                    if platform.system() == 'Windows':
-                        pdir = pdir.replace('/', '\\')
-
-                    # get unique directory prefix name
-                    unique_dir = MakeRelease.release_dir
-
-                    # get list of path components
-                    path_component_list = pdir.split(os.path.sep)
-
-                    # create install directory
-                    dir_name: str = os.path.join(os.path.join(self.gettempdir(), unique_dir), pdir)
-                    MakeRelease.mkdir(dir_name)
-
-                    self.logDebug('creating install dir: {}'.format(dir_name))
-
-                    to_delete = os.path.join(self.gettempdir(), unique_dir)
-                    # to_delete = dir_name
-
-                    load_list = [pdir + '/' + os.path.basename(e) for e in user_file_list]
-                    self.doResources(resource_list, dir_name)
-
-                    # copy files to temporary release directory
-                    # create temporary tar file
-                    tmp_tar = os.path.join(self.gettempdir(), os.path.join(unique_dir, "tqr.tar.gz"))
-                    self.doCreateTar("gz", tmp_tar, file_list)
-
-                    # unpack release in new position
-                    os.chdir(dir_name)
-                    self.doExtractTar("gz", tmp_tar)
-
-                    # move module files to new location
-                    if (self._opts.mod):
-                        target_dir = ''
-                        done: dict = {}
-                        for fn in self._ulist:
-                            if re.search('\\.qm$', fn):
-                                # do not move module files in a directory with the same name
-                                bn: str = os.path.basename(fn)
-                                if (os.path.basename(os.path.dirname(fn)) + ".qm") == bn:
-                                    continue
-                                if bn in done:
-                                    continue
-
-                                if not target_dir:
-                                    target_dir = os.path.join(self.gettempdir(), os.path.join(unique_dir, "user/modules"))
-                                    MakeRelease.mkdir(target_dir, mode=0o755)
-
-                                # move module file to target
-                                targ = os.path.join(target_dir, os.path.basename(fn))
-                                os.rename(fn, targ)
-                                done[bn] = True
-
-                    # create tar file
-                    os.chdir(os.path.join(self.gettempdir(), unique_dir))
-                    self.doCreateTar("gz", os.path.join(rname, tar_file_name), [path_component_list[0]])
-                    os.chdir(self._cwd)
-                finally:
-                    if not self._opts.keep and to_delete:
-                        self.delTree(to_delete)
-                        # self.deleteFolder(to_delete)
+                pdir = self._opts.padd
+
+                if _IS_WINDOWS:
+                    pdir = pdir.replace('/', '\\')
+
+                load_list = [pdir + '/' + os.path.basename(e) for e in self._ulist]
+                members = {}
+                self.doResources(resource_list, pdir, members)
+
+                # add files directly to the archive with the prefix directory prepended
+                fn: str
+                for fn in file_list:
+                    members[os.path.join(pdir, fn)] = self.srcPath(fn)
+
+                # move module files to new location
+                qm_files: list = [fn for fn in self._ulist if fn.endswith('.qm')] if self._opts.mod else []
+                if qm_files:
+                    done: set = set()
+                    for fn in qm_files:
+                        # do not move module files in a directory with the same name
+                        bn: str = os.path.basename(fn)
+                        if (os.path.basename(os.path.dirname(fn)) + ".qm") == bn:
+                            continue
+                        if bn in done:
+                            continue
+
+                        # move module file to target
+                        members.pop(os.path.join(pdir, fn), None)
+                        members[os.path.join("user", "modules", bn)] = self.srcPath(fn)
+                        done.add(bn)
             else:
-                self.doCreateTar("gz", os.path.join(rname, tar_file_name), file_list)
-                load_list = user_file_list
-
-            print("created user tar file {}/{}".format(rname, tar_file_name))
+                members = {fn: self.srcPath(fn) for fn in file_list}
+                load_list = self._ulist
 
             if self._opts.pymoddir:
-                os.chdir(rname)
-                temp = MakeRelease.release_dir
-                MakeRelease.mkdir(temp)
-
-                self.doExtractTar("gz", tar_file_name, temp)
-                dest = os.path.join(rname, os.path.join(temp, self._opts.pymoddest))
-                MakeRelease.mkdir(dest)
+                members[os.path.join(self._opts.pymoddest, os.path.basename(self._opts.pymoddir))] = \
+                    self._opts.pymoddir
 
-                self.copyFiles([self._opts.pymoddir], os.path.join(dest, os.path.basename(self._opts.pymoddir)))
-                os.chdir(temp)
+            # create tar file
+            if self._opts.pref or self._opts.padd or self._opts.pymoddir:
+                self.doCreateTarMembers("gz", os.path.join(rname, tar_file_name), members)
+            else:
+                # files keep their paths relative to the source dir; use the native tar binary if possible
+                self.doCreateTar("gz", os.path.join(rname, tar_file_name), file_list, root=self._opts.usrc)
 
-                self.doCreateTar("gz", os.path.join(rname, tar_file_name), glob.glob('*'))
-                self.delTree(os.path.join(rname, temp))
+            print("created user tar file {}/{}".format(rname, tar_file_name))
+            if self._opts.pymoddir:
                 print("Adding python module at destination: {}".format(self._opts.pymoddest))
 
             # create release file
@@ -753,24 +871,21 @@ class MakeRelease:
             if self._opts.comp:
                 # save current working directory
                 print('rname: {} ut: {}'.format(rname, tar_file_name))
-                os.chdir(os.path.dirname(rname))
                 # make compressed release tar.bz2; exclude backup files
                 tar = label + ".tar.bz2"
-                self.doCreateTar("bz2", tar, [label], exclude=True)
-                print("create release archive: {}/{}".format(os.getcwd(), tar))
+                self.doCreateTar("bz2", os.path.join(os.path.dirname(rname), tar), [label], exclude=True,
+                    root=os.path.dirname(rname))
+                print("create release archive: {}/{}".format(os.path.dirname(rname), tar))
 
             if self._opts.inst:
-                os.chdir(rname)
-
-                opts = ""
+                opts: list = []
                 if self._opts.verbose:
-                    opts += " -v"
+                    opts.append("-v")
                 if self._opts.full:
-                    opts += " -F"
+                    opts.append("-F")
 
-                MakeRelease.doCmd("sh ./install.sh" + opts)
+                MakeRelease.doCmd(["sh", "./install.sh"] + opts, cwd=rname)
 
-            os.chdir(self._cwd)
             print("done!")
 
 
@@ -1,15 +1,22 @@
 #!/usr/bin/env python3
 
 import asyncio
+import collections
+import concurrent.futures
+import dataclasses
 import datetime
 import getopt
+import hashlib
+import json
 import os
 import requests
+import requests.adapters
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 import socket
 import ssl
 import sys
+import time
 import traceback
 import websocket
 import yaml
@@ -20,13 +27,55 @@ warnings.filterwarnings(action="ignore", message="unclosed", category=ResourceWa
 
 # server messages:
 QCM_TextOutput = 'text-output'
+# raw binary text output frames: this type byte followed by the UTF-8 encoded output
+QCM_RawTextOutput = b'\x01'
+
+# maximum number of concurrent file uploads
+UPLOAD_WORKERS = 8
+
+# yaml files are parsed in parallel processes if there are more than this many and more than one CPU
+YAML_PARALLEL_MIN = 32
+
+# websocket tokens are cached per URL and login for this many seconds
+WSTOKEN_TTL = 300
+WSTOKEN_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'qorus-remote')
+
+# use the libyaml-backed loader and dumper if available
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YamlDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+# HTTP session shared by the token request, file uploads and the remote directory delete, so that the
+# connection to the server is kept alive and reused
+SESSION = requests.Session()
+SESSION.verify = False
+SESSION.mount('https://', requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16))
+SESSION.mount('http://', requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+# settings from the netrc file and the command to execute
+@dataclasses.dataclass
+class Ctx:
+    url: str = ''
+    # HTTP(S) URL of the server for the REST and file upload requests
+    http_url: str = ''
+    login: str = ''
+    password: str = ''
+    timeout: str = ''
+    verbose: bool = False
+    nodelete: bool = False
+    nocache: bool = False
+    cmd: dict = dataclasses.field(default_factory=dict)
+
+CTX = Ctx()
+
+# local path and relative target name of a file to upload
+PathInfo = collections.namedtuple('PathInfo', 'path relname')
 
 def remote_print(string):
-    if globals.get('verbose', '') == "yes":
+    if CTX.verbose:
         print(string)
 
 def remote_print_exception(e):
-    if globals.get('verbose', '') == "yes":
+    if CTX.verbose:
         tb_lines = traceback.format_exception(e.__class__, e, e.__traceback__)
         tb_text = ''.join(tb_lines)
         remote_print(tb_text)
@@ -36,8 +85,8 @@ def remote_print_exception(e):
     sys.exit(1)
 
 def print_args():
-    remote_print("Will execute: {}".format(globals['cmd']['cmd']))
-    remote_print("Arguments: {}".format(" ".join(globals['cmd']['args'])))
+    remote_print("Will execute: {}".format(CTX.cmd['cmd']))
+    remote_print("Arguments: {}".format(" ".join(CTX.cmd['args'])))
 
 
 def remote_print_usage(code):
@@ -48,6 +97,10 @@ Examples:
     sys.exit(code)
 
 
+# netrc keys stored directly in the context
+NETRC_STR_KEYS = frozenset(('login', 'password', 'timeout'))
+NETRC_FLAG_KEYS = frozenset(('verbose', 'nodelete', 'nocache'))
+
 def extract_netrc(netrc_file):
     if not os.path.exists(netrc_file):
         print("netrc configuration file \"{}\" does not exist".format(netrc_file))
@@ -55,23 +108,27 @@ def extract_netrc(netrc_file):
 
     try:
         with open(netrc_file,'r') as f:
-            for line in f:
-                if 'machine ' in line:
-                    machine = line.replace('machine ', '').rstrip()
-                elif 'port ' in line:
-                    port = line.replace('port ', '').rstrip()
-                elif 'secure ' in line:
-                    secure = line.replace('secure ', '').rstrip()
-                elif 'login ' in line:
-                    globals['login'] = line.replace('login ', '').rstrip()
-                elif 'password ' in line:
-                    globals['password'] = line.replace('password ', '').rstrip()
-                elif 'timeout ' in line:
-                    globals['timeout'] = line.replace('timeout ', '').rstrip()
-                elif 'verbose ' in line:
-                    globals['verbose'] = line.replace('verbose ', '').rstrip()
-                elif 'nodelete ' in line:
-                    globals['nodelete'] = line.replace('nodelete ', '').rstrip()
+            text: str = f.read()
+
+        machine: str = ''
+        port: str = ''
+        secure: str = ''
+        for line in text.splitlines():
+            parts: list = line.split(None, 1)
+            if len(parts) != 2:
+                continue
+            key, val = parts
+            val = val.rstrip()
+            if key in NETRC_STR_KEYS:
+                setattr(CTX, key, val)
+            elif key in NETRC_FLAG_KEYS:
+                setattr(CTX, key, val == "yes")
+            elif key == 'machine':
+                machine = val
+            elif key == 'port':
+                port = val
+            elif key == 'secure':
+                secure = val
 
         if not machine and not port and not secure:
             print("Impossible to find the netrc configuration in this file: \"{}\"".format(netrc_file))
@@ -85,32 +142,33 @@ def extract_netrc(netrc_file):
         elif not secure:
             print("\"secure\" field is not defined in the netrc configuration file \"{}\"".format(netrc_file))
             return False
-        elif 'login' not in globals:
+        elif not CTX.login:
             print("\"login\" field is not defined in the netrc configuration file \"{}\"".format(netrc_file))
             return False
-        elif 'password' not in globals:
+        elif not CTX.password:
             print("\"password\" field is not defined in the netrc configuration file \"{}\"".format(netrc_file))
             return False
 
         if secure and secure == "yes":
-            globals['URL'] = "wss://{}:{}/".format(machine, port)
+            CTX.url = "wss://{}:{}/".format(machine, port)
         else:
-            globals['URL'] = "ws://{}:{}/".format(machine, port)
+            CTX.url = "ws://{}:{}/".format(machine, port)
+        CTX.http_url = CTX.url.replace('wss', 'https').replace('ws', 'http')
 
+        SESSION.auth = requests.auth.HTTPBasicAuth(CTX.login, CTX.password)
         return True
     except Exception as e:
         print('Error while extracting URL from .netrc file')
         remote_print_exception(e)
 
 
-def parse_args(args):
-    opts_h = ['-h', '--help', '--usage']
+_HELP_OPTS = frozenset(('-h', '--help', '--usage'))
 
+def parse_args(args):
     try:
-        for o in opts_h:
-            if o in args[:2 if len(args) >= 2 else 1]:
-                remote_print_usage(0)
-        if not args[0] or args[0] == "-h" or args[0] == "--help" or args[0] == "--usage":
+        if not _HELP_OPTS.isdisjoint(args[:2]):
+            remote_print_usage(0)
+        if not args[0] or args[0] in _HELP_OPTS:
             remote_print_usage(1)
 
         netrc_file = args[0]
@@ -123,6 +181,8 @@ def parse_args(args):
         cmd = {}
         cmd['cmd'] = args[1]
         cmd['args'] = args[2:]
+        # tell the server that text output can be sent as raw binary frames
+        cmd['framing'] = 'raw'
 
         return cmd
     except Exception as e:
@@ -131,7 +191,12 @@ def parse_args(args):
 
 def on_message(ws, message):
     try:
-        msg = yaml.safe_load(message)
+        # raw text output needs no parsing
+        if isinstance(message, (bytes, bytearray)) and message[:1] == QCM_RawTextOutput:
+            sys.stdout.buffer.write(message[1:])
+            sys.stdout.flush()
+            return
+        msg = yaml.load(message, Loader=YamlLoader)
         if msg['msgtype'] == QCM_TextOutput:
             print(msg['data'], end='', flush=True)
         else:
@@ -143,51 +208,125 @@ def on_message(ws, message):
 def on_error(ws, error):
     print("Websocket error:", error)
 
-def on_close(ws, close_status_code, close_msg):
-    pass
-
 def on_open(ws):
-    remote_print(yaml.dump(globals['cmd']))
-    ws.send(yaml.dump(globals['cmd']))
+    # flow style gives the most compact encoding for the command's file and option lists
+    cmd: str = yaml.dump(CTX.cmd, Dumper=YamlDumper, default_flow_style=True)
+    remote_print(cmd)
+    ws.send(cmd)
+
+def wstoken_cache_path() -> str:
+    key: str = '{}\0{}'.format(CTX.url, CTX.login)
+    return os.path.join(WSTOKEN_CACHE_DIR, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.json')
+
+# returns a cached websocket token that is still valid for at least 30 seconds, if any
+def read_wstoken_cache() -> str:
+    if CTX.nocache:
+        return ''
+    try:
+        with open(wstoken_cache_path(), 'r') as f:
+            cache: dict = json.load(f)
+        if cache['exp'] > time.time() + 30:
+            return cache['token']
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return ''
+
+def write_wstoken_cache(token: str):
+    if CTX.nocache:
+        return
+    try:
+        os.makedirs(WSTOKEN_CACHE_DIR, mode=0o700, exist_ok=True)
+        fd: int = os.open(wstoken_cache_path(), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'token': token, 'exp': time.time() + WSTOKEN_TTL}, f)
+    except OSError as e:
+        remote_print('Cannot write websocket token cache: {}'.format(e))
+
+def clear_wstoken_cache():
+    try:
+        os.remove(wstoken_cache_path())
+    except OSError:
+        pass
+
+def get_wstoken() -> str:
+    url = '{}api/latest/system/wstoken?err=1'.format(CTX.http_url)
+    token = SESSION.get(url)
+    # issue #2: check status code of token response
+    if (token.status_code / 100) != 2:
+        if token.status_code == 409 and 'application/json' in token.headers['content-type']:
+            body = token.json()
+            loc = body['file']
+            line = body['line'] + body['offset']
+            err = body['err']
+            desc = body['desc']
+            raise RuntimeError(f'Qorus server error at {loc}:{line}: {err}: {desc}')
+        raise IOError(f'Error status code {token.status_code}: {token.text}')
+    tok: str = token.text.strip('\"')
+    write_wstoken_cache(tok)
+    return tok
+
+def ws_connect(connection: str, tok: str):
+    return websocket.create_connection(connection,
+        header = ['Qorus-Token: {}'.format(tok)],
+        sslopt = {"cert_reqs": ssl.CERT_NONE},
+        skip_utf8_validation = True)
 
 def exec_cmd():
     try:
-        connection = "{}remote-command".format(globals['URL'])
-        url = '{}api/latest/system/wstoken?err=1'.format(globals['URL'].replace('wss', 'https').replace('ws', 'http'))
-        token = requests.get(url, auth=requests.auth.HTTPBasicAuth(globals['login'], globals['password']), verify=False)
-        # issue #2: check status code of token response
-        if (token.status_code / 100) != 2:
-            if token.status_code == 409 and 'application/json' in token.headers['content-type']:
-                body = token.json()
-                loc = body['file']
-                line = body['line'] + body['offset']
-                err = body['err']
-                desc = body['desc']
-                raise RuntimeError(f'Qorus server error at {loc}:{line}: {err}: {desc}')
-            raise IOError(f'Error status code {token.status_code}: {token.text}')
-        remote_print('Qorus-Token: {}'.format(token.text.strip('\"')))
-        ws = websocket.WebSocketApp(connection,
-            on_message = on_message,
-            on_open = on_open,
-            on_error = on_error,
-            on_close = on_close,
-            header = { 'Qorus-Token': token.text.strip('\"')})
-        ws.run_forever(sslopt={"cert_reqs": ssl.CERT_NONE})
+        connection = "{}remote-command".format(CTX.url)
+        tok: str = read_wstoken_cache()
+        cached: bool = bool(tok)
+        if not cached:
+            tok = get_wstoken()
+        remote_print('Qorus-Token: {}{}'.format(tok, ' (cached)' if cached else ''))
+        # the client only sends the command and then receives output until the server closes the
+        # connection, so read frames directly instead of through WebSocketApp's callback dispatcher
+        ws = None
+        while not ws:
+            try:
+                ws = ws_connect(connection, tok)
+            except websocket.WebSocketBadStatusException as e:
+                if cached and getattr(e, 'status_code', None) == 401:
+                    # the cached token is no longer accepted; get a new one and try again
+                    clear_wstoken_cache()
+                    tok = get_wstoken()
+                    cached = False
+                    remote_print('Qorus-Token: {}'.format(tok))
+                    continue
+                on_error(ws, e)
+                return
+            except (websocket.WebSocketException, OSError) as e:
+                on_error(ws, e)
+                return
+        try:
+            on_open(ws)
+            while True:
+                try:
+                    message = ws.recv()
+                except websocket.WebSocketConnectionClosedException:
+                    break
+                if not message:
+                    break
+                on_message(ws, message)
+        except (websocket.WebSocketException, OSError) as e:
+            on_error(ws, e)
+        finally:
+            ws.close()
     except Exception as e:
         print('Exception executing command')
         remote_print_exception(e)
 
 # oload functions
-def oload_check_option_with_spaced_arg(opt):
-    possibilities = {'-' : ['p', 'r', 's', 't', 'u', 'D', 'L', 'X'],
-                     '--': ['schema', 'user-schema', 'url', 'proxy-url', 'data-ts', 'index-ts', 'delete',
-                            'delete-id', 'datasource', 'list', 'refresh', 'token', 'export-cfg-val', 'show-release']
-    }
+# oload options that take their argument as the next command-line argument
+_SHORT_SPACED = frozenset('prstuDLX')
+_LONG_SPACED = frozenset(('schema', 'user-schema', 'url', 'proxy-url', 'data-ts', 'index-ts', 'delete',
+                          'delete-id', 'datasource', 'list', 'refresh', 'token', 'export-cfg-val', 'show-release'))
 
-    if opt[:2] in possibilities:
-        return opt[2:] in possibilities[opt[:2]]
-    elif opt[:1] in possibilities:
-        return opt[1:] in possibilities[opt[:1]]
+def oload_check_option_with_spaced_arg(opt):
+    if opt.startswith('--'):
+        return opt[2:] in _LONG_SPACED
+    elif opt.startswith('-'):
+        return opt[1:] in _SHORT_SPACED
 
     return False
 
@@ -217,9 +356,8 @@ def oloadparse_args(args):
 
 def oload_remove_dir(ofiles):
     try:
-        for ofile in ofiles:
-            if os.path.isdir(ofile):
-                ofiles.remove(ofile)
+        # filter in place; removing entries while iterating over the list skips elements
+        ofiles[:] = [ofile for ofile in ofiles if not os.path.isdir(ofile)]
     except Exception as e:
         print('Exception when removing directories from oload arguments')
         remote_print_exception(e)
@@ -238,91 +376,125 @@ def oload_remove_dir_from_files(ofiles):
 
 def oload_remove_files(ofiles):
     try:
+        files: list = []
         for ofile in ofiles:
-            if not os.path.exists(ofile):
-                ofiles.remove(ofile)
+            if os.path.exists(ofile):
+                files.append(ofile)
+            else:
                 print('File does not exist: {}'.format(ofile))
+        ofiles[:] = files
     except Exception as e:
         print('Exception when removing non-existing files from oload arguments')
         remote_print_exception(e)
 
 
-def oload_add_src_files(ofiles: set, filemap: dict) -> list:
-    try:
-        sfiles: list = []
-        ofile: str
-        for ofile in ofiles:
-            done: bool = False
-            if ofile[-5:] == '.yaml' or ofile[-4:] == '.yml':
-                with open(ofile) as of:
-                    doc = yaml.full_load(of)
-                    if doc.get('code'):
-                        path: str = os.path.join(os.path.dirname(ofile), doc.get('code'))
-                        sfiles.append(path)
-                        filemap[path] = doc.get('code')
-                        done = True
+# parsed yaml documents keyed by (realpath, mtime), so that each file is only parsed once
+_yaml_cache: dict = {}
 
-            if not done:
-                filemap[ofile] = os.path.basename(ofile)
+def _yaml_key(path: str) -> tuple:
+    return (os.path.realpath(path), os.stat(path).st_mtime_ns)
+
+def _parse_one(path: str) -> tuple:
+    with open(path, 'rb') as of:
+        return path, yaml.load(of, Loader=YamlLoader)
+
+def _load_yaml(path: str):
+    key: tuple = _yaml_key(path)
+    if key not in _yaml_cache:
+        _yaml_cache[key] = _parse_one(path)[1]
+    return _yaml_cache[key]
+
+# parses large numbers of yaml files in a process pool and caches the documents for _load_yaml()
+def _preload_yaml(paths: list):
+    if len(paths) <= YAML_PARALLEL_MIN or (os.cpu_count() or 1) < 2:
+        return
+    # the default worker count is the number of CPUs, capped where the platform requires it (Windows)
+    with concurrent.futures.ProcessPoolExecutor() as executor:
+        path: str
+        for path, doc in executor.map(_parse_one, paths, chunksize=8):
+            _yaml_cache[_yaml_key(path)] = doc
 
-        return sfiles
-    except Exception as e:
-        print('Exception when adding source file for yaml files')
-        remote_print_exception(e)
 
 # recursively process resource files/directories
 def oload_process_resource_path(rfiles: list, path: str, root: str, filemap: dict):
-    if '*' in path:
-        g: str
-        for g in glob.glob(path):
-            oload_process_resource_path(rfiles, g, root, filemap)
-    else:
-        if os.path.isdir(path):
-            oload_process_resource_path(rfiles, path + '/*', root, filemap)
-        else:
-            rfiles.append(path)
-            filemap[path] = os.path.relpath(path, root)
+    stack: list = [path]
+    while stack:
+        p: str = stack.pop()
+        if '*' in p:
+            stack.extend(glob.iglob(p))
+            continue
 
-def oload_add_resource_files(ofiles: set, filemap: dict) -> list:
+        try:
+            it = os.scandir(p)
+        except OSError:
+            # not a directory
+            rfiles.append(p)
+            filemap[p] = os.path.relpath(p, root)
+            continue
+
+        with it:
+            entry: os.DirEntry
+            for entry in it:
+                # skip hidden files like glob() did
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir():
+                    stack.append(entry.path)
+                else:
+                    rfiles.append(entry.path)
+                    filemap[entry.path] = os.path.relpath(entry.path, root)
+
+# scans the given files once and returns the source files of yaml files, their resources and schemas, and the
+# files loaded by qrf files
+def oload_scan(ofiles: set, filemap: dict) -> list:
     try:
+        sfiles: list = []
         rfiles: list = []
+        qfiles: list = []
+        _preload_yaml([ofile for ofile in ofiles if ofile.endswith('.yaml') or ofile.endswith('.yml')])
         ofile: str
         for ofile in ofiles:
-            if ofile[-5:] == '.yaml' or ofile[-4:] == '.yml':
+            done: bool = False
+            if ofile.endswith('.yaml') or ofile.endswith('.yml'):
+                doc = _load_yaml(ofile)
+                root: str = os.path.dirname(ofile)
+
+                # add source file
+                if doc.get('code'):
+                    path: str = os.path.join(root, doc.get('code'))
+                    sfiles.append(path)
+                    filemap[path] = doc.get('code')
+                    done = True
+
+                # add resources
+                for r in doc.get('resource', []):
+                    path = os.path.join(root, r)
+                    oload_process_resource_path(rfiles, path, root, filemap)
+
+                # add API management resources
+                if 'api-manager' in doc \
+                    and 'provider-options' in doc['api-manager'] \
+                    and 'schema' in doc['api-manager']['provider-options'] \
+                    and 'value' in doc['api-manager']['provider-options']['schema']:
+                    schema_file: str = doc['api-manager']['provider-options']['schema']['value']
+                    path = os.path.join(root, schema_file)
+                    rfiles.append(path)
+                    filemap[path] = schema_file
+            elif ofile.endswith('.qrf'):
                 with open(ofile) as of:
-                    doc = yaml.full_load(of)
-                    for r in doc.get('resource', []):
-                        root: str = os.path.dirname(ofile)
-                        path = os.path.join(root, r)
-                        oload_process_resource_path(rfiles, path, root, filemap)
-                    # add API management resources
-                    if 'api-manager' in doc \
-                        and 'provider-options' in doc['api-manager'] \
-                        and 'schema' in doc['api-manager']['provider-options'] \
-                        and 'value' in doc['api-manager']['provider-options']['schema']:
-                        schema_file: str = doc['api-manager']['provider-options']['schema']['value']
-                        path = os.path.join(os.path.dirname(ofile), schema_file)
-                        rfiles.append(path)
-                        filemap[path] = schema_file
-
-        return rfiles
-    except Exception as e:
-        print('Exception when checking files for resource')
-        remote_print_exception(e)
+                    lines: list = of.read().splitlines()
+                for line in lines:
+                    line = line.rstrip()
+                    if line.startswith('load '):
+                        qfiles.append(os.path.join(os.path.dirname(ofile), line[5:]))
 
-def oload_add_qrf_files(ofiles):
-    try:
-        qfiles = []
-        for ofile in ofiles:
-            if ofile[-4:] == '.qrf':
-                with open(ofile) as of:
-                    for line in of:
-                        if 'load ' in line:
-                            l = line.replace('load ', '').rstrip()
-                            qfiles.append(os.path.join(os.path.dirname(ofile), l))
-        return qfiles
+            # explicit target names found while scanning other files take precedence
+            if not done:
+                filemap.setdefault(ofile, os.path.basename(ofile))
+
+        return sfiles + rfiles + qfiles
     except Exception as e:
-        print('Exception when checking qrf files')
+        print('Exception when scanning files to load')
         remote_print_exception(e)
 
 # ofiles: original file list to process
@@ -331,20 +503,30 @@ def oload_add_files(ofiles: set, filemap: dict) -> set:
     todo: set = ofiles.copy()
     toUpload: set = ofiles
 
-    tmp = set()
-
-    remote_print('Checking for yaml files and add their source files if they are missing')
-    tmp.update(oload_add_src_files(todo, filemap))
+    remote_print('Checking yaml files for source files and resources and qrf files for files to load')
+    toUpload.update(oload_scan(todo, filemap))
 
-    remote_print('Checking service files for resource')
-    tmp.update(oload_add_resource_files(todo, filemap))
+    return toUpload
 
-    remote_print('Checking qrf files for files to load')
-    tmp.update(oload_add_qrf_files(todo))
 
-    toUpload.update(tmp)
+# raised for an upload rejected by the server; holds the server's response body
+class UploadError(IOError):
+    pass
 
-    return toUpload
+# uploads a single file; the open file object is streamed to the server in blocks by requests
+# instead of being read into memory first
+# base_headers is shared by concurrent uploads and is not modified here
+def oload_upload_file(url: str, ofile: str, filepath: str, base_headers: dict):
+    with open(ofile, 'rb') as data:
+        headers: dict = dict(base_headers)
+        headers['filepath'] = filepath
+        headers['Content-Length'] = str(os.fstat(data.fileno()).st_size)
+        res = SESSION.post(url, data=data, headers=headers)
+    # errors are reported with an error status code and/or an HTML error page
+    if res.status_code >= 400 or res.headers.get('content-type', '').startswith('text/html'):
+        # runs in worker threads; the error is reported by the caller
+        raise UploadError(res.content.decode('utf-8', 'replace'))
+    return res
 
 
 def oload_upload_files(files: set, filemap: dict, directory: str = '') -> str:
@@ -352,58 +534,67 @@ def oload_upload_files(files: set, filemap: dict, directory: str = '') -> str:
         return directory
 
     try:
-        url: str = '{}raw/remote-file'.format(globals['URL'].replace('wss', 'https').replace('ws', 'http'))
+        url: str = '{}raw/remote-file'.format(CTX.http_url)
 
-        print('Uploading files to remote host \"{}\": '.format(globals['URL']), end='')
-        if globals.get('verbose', '') == "yes":
+        print('Uploading files to remote host \"{}\": '.format(CTX.url), end='')
+        if CTX.verbose:
             print()
 
-        ofile: str
-        for ofile in files:
-            filename: str = filemap.get(ofile, os.path.basename(ofile))
-
-            if not directory:
-                d: str = os.path.dirname(ofile)
-                headers: dict = {'Content-Type': 'application/octet-stream', 'filepath': filename}
-                with open(ofile,'rb') as data:
-                    res = requests.post(url, data=data, headers=headers, verify=False,
-                        auth=requests.auth.HTTPBasicAuth(globals['login'], globals['password']))
-                    if '<html><head><title>' in res.text:
-                        print(res.text)
-                        sys.exit(1)
-                    else:
-                        directory = res.text
-                        remote_print('\nUploading into {} directory'.format(directory))
-            else:
-                headers: dict = {'Content-Type': 'application/octet-stream', 'filepath': filename, 'dir': directory}
-                with open(ofile,'rb') as data:
-                    res = requests.post(url, data=data, headers=headers, verify=False,
-                        auth=requests.auth.HTTPBasicAuth(globals['login'], globals['password']))
-                    if '<html><head><title>' in res.text:
-                        print(res.text)
-                        sys.exit(1)
-
-            if globals.get('verbose', '') == "yes":
-                remote_print('Uploaded {} -> {}'.format(ofile, filename))
+        def progress(info: PathInfo):
+            if CTX.verbose:
+                remote_print('Uploaded {} -> {}'.format(info.path, info.relname))
             else:
                 print('.', end='', flush=True)
 
-        if not globals.get('verbose', '') == "yes":
+        # resolve the target name of each file once
+        todo: list = [PathInfo(ofile, filemap.get(ofile, os.path.basename(ofile))) for ofile in files]
+        headers: dict = {'Content-Type': 'application/octet-stream'}
+
+        # the first upload creates the remote directory that the other files are uploaded into
+        if not directory:
+            info: PathInfo = todo.pop(0)
+            res = oload_upload_file(url, info.path, info.relname, headers)
+            directory = res.text
+            remote_print('\nUploading into {} directory'.format(directory))
+            progress(info)
+        headers['dir'] = directory
+
+        # the remaining uploads are independent of each other and are sent in parallel
+        if todo:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(UPLOAD_WORKERS, len(todo))) as executor:
+                futures: dict = {}
+                for info in todo:
+                    futures[executor.submit(oload_upload_file, url, info.path, info.relname, headers)] = info
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        # raises any error from the upload
+                        future.result()
+                    except BaseException:
+                        # do not send any queued uploads after the first error
+                        for f in futures:
+                            f.cancel()
+                        raise
+                    progress(futures[future])
+
+        if not CTX.verbose:
             print()
         return directory
+    except UploadError as e:
+        print(e)
+        sys.exit(1)
     except Exception as e:
         print('\nException when uploading files')
         remote_print_exception(e)
 
 
 def deleting_directory(directory):
-    if not (globals.get('nodelete', '') == 'yes'):
+    if not CTX.nodelete:
         try:
             remote_print('Deleting folder: {}'.format(directory))
-            url = '{}raw/remote-file'.format(globals['URL'].replace('wss', 'https').replace('ws', 'http'))
+            url = '{}raw/remote-file'.format(CTX.http_url)
             headers = { 'dir': directory }
             remote_print('Sending curl request at {}\n{}'.format(url, headers))
-            res = requests.delete(url, headers=headers, verify=False)
+            res = SESSION.delete(url, headers=headers)
         except Exception as e:
             print('Exception when deleting remote directory')
             remote_print_exception(e)
@@ -424,29 +615,28 @@ def oload_handle(args):
     toUpload: set = oload_add_files(set(ofiles), filemap)
     directory: str = oload_upload_files(toUpload, filemap)
 
-    if globals['cmd']['cmd'] == 'oload':
+    if CTX.cmd['cmd'] == 'oload':
         ofiles = oload_remove_dir_from_files(ofiles)
 
     remote_print('Executing \'oload {} "{}"\' on remote host'.format(oopts, " ".join(ofiles)))
-    globals['cmd']['args'] = []
-    globals['cmd']['files'] = ofiles
-    globals['cmd']['opts'] = oopts
-    globals['cmd']['dir'] = directory
+    CTX.cmd['args'] = []
+    CTX.cmd['files'] = ofiles
+    CTX.cmd['opts'] = oopts
+    CTX.cmd['dir'] = directory
     exec_cmd()
 
     deleting_directory(directory)
 
 
-globals = {}
 def main():
     if not sys.argv[1:]:
         remote_print_usage(1)
 
-    globals['cmd'] = parse_args(sys.argv[1:])
+    CTX.cmd = parse_args(sys.argv[1:])
     print_args()
 
-    if globals['cmd']['cmd'] == 'oload':
-        oload_handle(globals['cmd']['args'])
+    if CTX.cmd['cmd'] == 'oload':
+        oload_handle(CTX.cmd['args'])
     else:
         exec_cmd()
 